@@ -2,10 +2,16 @@
 
 import argparse
 from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
-from markdown import markdown
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import hashlib
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markdown import Markdown
+import os
 from pathlib import Path
+import re
 import sys
+import time
 
 from .util import find_files, find_key_defs, load_config, load_links, write_file
 
@@ -26,6 +32,27 @@ MARKDOWN_EXTENSIONS = [
     "tables"
 ]
 
+JINJA_CACHE_NAME = ".jinja-cache"
+
+MD_CACHE_NAME = ".md-cache"
+MD_CACHE_TTL = 7 * 24 * 60 * 60
+
+DOM_SENTINELS = ("data-file", 'id="terms"')
+A_HREF = re.compile(r'(<a\s[^>]*?href=")([^"]*)"')
+H1_TEXT = re.compile(r"<h1[^>]*>(.*?)</h1>", re.DOTALL)
+ROOT_ATTR = re.compile(r'(<(?:a|link|script)\b[^>]*?\s(?:href|src)=")@root/')
+TAG = re.compile(r"<[^>]+>")
+
+RENDER_PARALLEL_THRESHOLD = 4
+
+_LANG_CLASS = {}
+
+_PREFIX_CACHE = {}
+
+_WORKER_CONVERTER = None
+_WORKER_ENV = None
+_WORKER_TEMPLATES = {}
+
 
 def build(opt):
     """Main driver."""
@@ -34,59 +61,195 @@ def build(opt):
     config = load_config(opt.config)
     config["links_md"] = "\n".join(["", *(f"[{key}]: {url}" for key, url in config["links"].items())])
     skips = config["skips"] | {opt.out}
-    env = Environment(loader=FileSystemLoader(opt.templates))
 
     # Find and build files.
+    prune_markdown_cache(opt.out)
     files = find_files(opt, skips)
     markdown, also_html, others = split_files(files)
-    handle_markdown(env, opt, config, markdown)
-    handle_also_html(env, opt, config, also_html)
-    handle_others(env, opt, config, others)
+    handle_markdown(opt, config, markdown)
+    handle_also_html(opt, config, also_html)
+    handle_others(opt, config, others)
 
 
-def choose_template(env, source):
+_EXTENSIONS_FINGERPRINT = hashlib.blake2b(
+    "\n".join(MARKDOWN_EXTENSIONS).encode(), digest_size=8
+).hexdigest()
+
+
+@functools.lru_cache(maxsize=4096)
+def convert_markdown(out_dir, text):
+    """Convert Markdown text to HTML, reusing results for repeated content."""
+    digest = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    cache_path = Path(out_dir, MD_CACHE_NAME, f"{digest}-{_EXTENSIONS_FINGERPRINT}.html")
+    try:
+        return cache_path.read_text(encoding="utf-8")
+    except OSError:
+        pass
+    html = get_converter().reset().convert(text)
+    save_markdown_cache(cache_path, html)
+    return html
+
+
+def get_converter():
+    """Construct the Markdown converter once per process."""
+    global _WORKER_CONVERTER
+    if _WORKER_CONVERTER is None:
+        _WORKER_CONVERTER = Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return _WORKER_CONVERTER
+
+
+def prune_markdown_cache(out_dir):
+    """Discard cached conversions that have not been refreshed recently."""
+    cutoff = time.time() - MD_CACHE_TTL
+    for entry in Path(out_dir, MD_CACHE_NAME).glob("*"):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                entry.unlink()
+        except OSError:
+            pass
+
+
+def save_markdown_cache(cache_path, html):
+    """Save one rendered conversion atomically."""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    scratch = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    scratch.write_text(html, encoding="utf-8")
+    os.replace(scratch, cache_path)
+
+
+def choose_template(templates_dir, source):
     """Select a template."""
-    if source.name == "slides.md":
-        return env.get_template("slides.html")
-    return env.get_template("page.html")
+    name = "slides.html" if (source.name == "slides.md") else "page.html"
+    return get_template(templates_dir, name)
+
+
+def get_template(templates_dir, name):
+    """Fetch a compiled template once per process."""
+    global _WORKER_ENV
+    if _WORKER_ENV is None:
+        cache_dir = Path(JINJA_CACHE_NAME)
+        cache_dir.mkdir(exist_ok=True)
+        _WORKER_ENV = Environment(
+            loader=FileSystemLoader(templates_dir),
+            auto_reload=False,
+            cache_size=-1,
+            bytecode_cache=FileSystemBytecodeCache(str(cache_dir)),
+        )
+    if name not in _WORKER_TEMPLATES:
+        _WORKER_TEMPLATES[name] = _WORKER_ENV.get_template(name)
+    return _WORKER_TEMPLATES[name]
+
+
+def _needs_dom(html, full):
+    """Does this page contain anything that needs tree-level transformation?"""
+    if "<title></title>" not in html:
+        return True
+    if ("href='" in html) or ("src='" in html):
+        return True
+    return full and any(token in html for token in DOM_SENTINELS)
+
+
+def transform_text(html, source, full):
+    """Fill in the title and rewrite link targets without building a DOM."""
+    heading = H1_TEXT.search(html)
+    if heading is None:
+        print(f"{source} lacks H1 heading", file=sys.stderr)
+        sys.exit(1)
+    title = TAG.sub("", heading.group(1))
+    html = html.replace("<title></title>", f"<title>{title}</title>", 1)
+    if full:
+        html = A_HREF.sub(lambda match: match.group(1) + _rewrite_href(match.group(2)) + '"', html)
+    prefix = _depth_prefix(len(source.parents) - 1)
+    return ROOT_ATTR.sub(lambda match: match.group(1) + prefix, html)
+
+
+def _rewrite_href(href):
+    """Apply the anchor target rewrites to a single href value."""
+    if href.startswith("b:"):
+        return f"@root/bibliography.html#{href[2:]}"
+    if href.startswith("g:"):
+        return f"@root/glossary.html#{href[2:]}"
+    if href.endswith(".md"):
+        return href.replace(".md", ".html").lower()
+    if Path(href).suffix in ALSO_HTML_SUFFIX:
+        return f"{href}.html"
+    return href
+
+
+def apply_transformers(doc, source, context):
+    """Transform the document in a single pass over its nodes."""
+    prefix = _depth_prefix(len(source.parents) - 1)
+    full = bool(context)
+    seen = set()
+    names = ("a", "code", "link", "script") if full else ("a", "link", "script")
+    for node in doc.find_all(names):
+        if node.name == "a":
+            _transform_anchor(node, prefix, full, seen)
+        elif node.name == "link":
+            _transform_root_prefix(node, "href", prefix)
+        elif node.name == "script":
+            _transform_root_prefix(node, "src", prefix)
+        elif node.has_attr("data-file"):
+            _transform_inclusion(node)
+    do_title(doc, source, context)
+    if full:
+        insert_defined_terms(doc, source, seen, context, prefix)
+
+
+def _transform_anchor(node, prefix, full, seen):
+    """Rewrite a single anchor's target."""
+    href = node.get("href")
+    if href is None:
+        return
+    if full:
+        if href.startswith("b:"):
+            href = f"@root/bibliography.html#{href[2:]}"
+        elif href.startswith("g:"):
+            key = href[2:]
+            seen.add(key)
+            href = f"@root/glossary.html#{key}"
+        elif href.endswith(".md"):
+            href = href.replace(".md", ".html").lower()
+        elif Path(href).suffix in ALSO_HTML_SUFFIX:
+            href = f"{href}.html"
+    node["href"] = _root_prefixed(href, prefix)
 
 
-def do_bibliography_links(doc, source, context):
-    """Turn 'b:key' links into bibliography references."""
-    for node in doc.select("a[href]"):
-        if node["href"].startswith("b:"):
-            node["href"] = f"@root/bibliography.html#{node['href'][2:]}"
+def _transform_inclusion(node):
+    """Adjust classes of a file inclusion."""
+    language = _language_class(node["data-file"])
+    node["class"] = language
+    node.parent["class"] = language
 
 
-def do_cross_links(doc, source, context):
-    """Fix .md links in HTML."""
-    for node in doc.select("a[href]"):
-        if node["href"].endswith(".md"):
-            node["href"] = node["href"].replace(".md", ".html").lower()
-        elif Path(node["href"]).suffix in ALSO_HTML_SUFFIX:
-            node["href"] = f"{node['href']}.html"
+def _language_class(inc):
+    """Compute the language class for an inclusion, caching by spec."""
+    language = _LANG_CLASS.get(inc)
+    if language is None:
+        language = f"language-{Path(inc.partition(':')[0]).suffix.lstrip('.')}"
+        _LANG_CLASS[inc] = language
+    return language
 
 
-def do_glossary(doc, source, context):
-    """Turn 'g:key' links into glossary references and insert list of terms."""
-    seen = set()
-    for node in doc.select("a[href]"):
-        if node["href"].startswith("g:"):
-            key = node["href"][2:]
-            node["href"] = f"@root/glossary.html#{key}"
-            seen.add(key)
-    insert_defined_terms(doc, source, seen, context)
+def _transform_root_prefix(node, attr, prefix):
+    """Fix @root in a single node's attribute."""
+    value = node.get(attr)
+    if value is not None:
+        node[attr] = _root_prefixed(value, prefix)
+
+
+def _depth_prefix(depth):
+    """Compute the relative prefix to the site root once per depth."""
+    prefix = _PREFIX_CACHE.get(depth)
+    if prefix is None:
+        prefix = "./" if (depth == 0) else "../" * depth
+        _PREFIX_CACHE[depth] = prefix
+    return prefix
 
 
-def do_inclusion_classes(doc, source, context):
-    """Adjust classes of file inclusions."""
-    for node in doc.select("code[data-file]"):
-        inc = node["data-file"]
-        if ":" in inc:
-            inc = inc.split(":")[0]
-        language = f"language-{Path(inc).suffix.lstrip('.')}"
-        node["class"] = language
-        node.parent["class"] = language
+def _root_prefixed(value, prefix):
+    """Replace the @root marker with the relative prefix."""
+    return value.replace("@root/", prefix) if ("@root/" in value) else value
 
 
 def do_title(doc, source, context):
@@ -98,33 +261,18 @@ def do_title(doc, source, context):
         sys.exit(1)
 
 
-def do_root_path_prefix(doc, source, context):
-    """Fix @root links in HTML."""
-    depth = len(source.parents) - 1
-    prefix = "./" if (depth == 0) else "../" * depth
-    targets = (
-        ("a[href]", "href"),
-        ("link[href]", "href"),
-        ("script[src]", "src"),
-    )
-    for selector, attr in targets:
-        for node in doc.select(selector):
-            if "@root/" in node[attr]:
-                node[attr] = node[attr].replace("@root/", prefix)
-
-
-def handle_also_html(env, opt, config, files):
+def handle_also_html(opt, config, files):
     """Handle files that are also saved as HTML files."""
     for path, info in files.items():
         output_path = make_output_path(opt.out, config["renames"], path)
         write_file(output_path, info["content"])
 
         embedded = AS_HTML.format(path=path, content=info["content"])
-        embedded = render_markdown(env, opt, config["links_md"], path, embedded)
-        write_file(Path(f"{output_path}.html"), str(embedded))
+        embedded = render_markdown(opt, config["links_md"], path, embedded)
+        write_file(Path(f"{output_path}.html"), embedded)
 
 
-def handle_markdown(env, opt, config, files):
+def handle_markdown(opt, config, files):
     """Handle Markdown files."""
     # Extract cross-reference keys.
     context = {
@@ -132,26 +280,39 @@ def handle_markdown(env, opt, config, files):
         "glossary": find_key_defs(files, "glossary"),
     }
 
-    # Render all documents.
-    for path, info in files.items():
-        info["doc"] = render_markdown(env, opt, config["links_md"], path, info["content"], context)
+    # Render all documents, in parallel when there are enough to be worth it.
+    tasks = [
+        (opt, config["links_md"], path, info["content"], context)
+        for path, info in files.items()
+    ]
+    if len(tasks) < RENDER_PARALLEL_THRESHOLD:
+        results = map(render_one, tasks)
+    else:
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(render_one, tasks, chunksize=4))
 
     # Save results.
-    for path, info in files.items():
+    for path, doc in results:
         output_path = make_output_path(opt.out, config["renames"], path)
-        write_file(output_path, str(info["doc"]))
+        write_file(output_path, doc)
+
+
+def render_one(task):
+    """Render a single Markdown file (run in a worker process)."""
+    opt, links, path, content, context = task
+    return path, render_markdown(opt, links, path, content, context)
 
 
-def handle_others(env, opt, config, files):
+def handle_others(opt, config, files):
     """Handle copy-only files."""
     for path, info in files.items():
         output_path = make_output_path(opt.out, config["renames"], path)
         write_file(output_path, info["content"])
 
 
-def insert_defined_terms(doc, source, seen, context):
+def insert_defined_terms(doc, source, seen, context, prefix):
     """Insert list of defined terms."""
-    target = doc.select("p#terms")
+    target = doc.find_all("p", id="terms")
     if not target:
         return
     assert len(target) == 1, f"Duplicate p#terms in {source}"
@@ -165,7 +326,7 @@ def insert_defined_terms(doc, source, seen, context):
     for i, (key, term) in enumerate(glossary.items()):
         if i > 0:
             target.append(", ")
-        ref = doc.new_tag("a", href=f"@root/glossary.html#{key}")
+        ref = doc.new_tag("a", href=f"{prefix}glossary.html#{key}")
         ref.string = term
         target.append(ref)
 
@@ -174,7 +335,8 @@ def make_output_path(output_dir, renames, source):
     """Build output path."""
     if source.name in renames:
         source = Path(source.parent, renames[source.name])
-    source = Path(str(source).replace(".md", ".html"))
+    if source.suffix == ".md":
+        source = source.with_suffix(".html")
     return Path(output_dir, source)
 
 
@@ -188,29 +350,20 @@ def parse_args(parser):
     parser.add_argument("--templates", type=str, default="templates", help="templates directory")
 
 
-def render_markdown(env, opt, links, source, content, context={}):
-    """Convert Markdown to HTML."""
+def render_markdown(opt, links, source, content, context={}):
+    """Convert Markdown to HTML and return the serialized page."""
     # Generate HTML.
-    template = choose_template(env, source)
+    template = choose_template(opt.templates, source)
     content += links
-    html = markdown(content, extensions=MARKDOWN_EXTENSIONS)
+    html = convert_markdown(opt.out, content)
     html = template.render(content=html, css_file=opt.css, icon_file=opt.icon)
 
-    # Apply transforms if always required or if context provided.
-    transformers = (
-        (False, do_bibliography_links),
-        (False, do_cross_links),
-        (False, do_glossary),
-        (False, do_inclusion_classes),
-        (True, do_title),
-        (True, do_root_path_prefix), # must be last
-    )
-    doc = BeautifulSoup(html, "html.parser")
-    for is_required, func in transformers:
-        if context or is_required:
-            func(doc, source, context)
-
-    return doc
+    # Transform tree-dependent pages through the DOM, the rest as text.
+    if _needs_dom(html, bool(context)):
+        doc = BeautifulSoup(html, "lxml")
+        apply_transformers(doc, source, context)
+        return str(doc)
+    return transform_text(html, source, bool(context))
 
 
 def split_files(files):
@@ -2,8 +2,13 @@
 
 import argparse
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
 from pathlib import Path
+import pickle
 import re
+import time
 
 from .util import GLOSS_REF, SUFFIXES, find_files, find_key_defs, load_config, load_links
 
@@ -12,24 +17,58 @@ BIB_REF = re.compile(r"\[.+?\]\(b:(.+?)\)", re.MULTILINE)
 FIGURE_CAPTION = re.compile(r"<figcaption>(.+?)</figcaption>", re.MULTILINE)
 FIGURE_DEF = re.compile(r'<figure\s+id="(.+?)"\s*>', re.MULTILINE)
 FIGURE_REF = re.compile(r"\[[^\]]+?\]\(f:(.+?)\)", re.MULTILINE)
-MD_CODEBLOCK_FILE = re.compile(r'^```\s*\{\s*file="(.+?)"\s*\}\s*$(.+?)```\s*$', re.DOTALL + re.MULTILINE)
 MD_FILE_LINK = re.compile(r"\[(.+?)\]\((.+?)\)", re.MULTILINE)
 MD_LINK_REF = re.compile(r"\[(.+?)\]\[(.+?)\]", re.MULTILINE)
 TABLE_DEF = re.compile(r'<table\s+id="(.+?)"\s*>', re.MULTILINE)
 TABLE_REF = re.compile(r"\[[^\]]+?\]\(t:(.+?)\)", re.MULTILINE)
 
+SCAN_PATTERNS = {
+    "bib_ref": BIB_REF,
+    "figure_caption": FIGURE_CAPTION,
+    "figure_def": FIGURE_DEF,
+    "figure_ref": FIGURE_REF,
+    "gloss_ref": GLOSS_REF,
+    "link_ref": MD_LINK_REF,
+    "md_link": MD_FILE_LINK,
+    "table_def": TABLE_DEF,
+    "table_ref": TABLE_REF,
+}
+
+SCAN_HINTS = {
+    "bib_ref": "](b:",
+    "figure_caption": "<figcaption>",
+    "figure_def": "<figure",
+    "figure_ref": "](f:",
+    "gloss_ref": "](g:",
+    "link_ref": "][",
+    "md_link": "](",
+    "table_def": "<table",
+    "table_ref": "](t:",
+}
+
+PARALLEL_THRESHOLD = 8
+
+CACHE_NAME = ".lint-cache.pkl"
+CACHE_TTL = 24 * 60 * 60
+CACHE_LIMIT = 2000
+SCAN_FINGERPRINT = hashlib.blake2b(
+    "\n".join(p.pattern for p in SCAN_PATTERNS.values()).encode()
+).hexdigest()
+
 
 def lint(opt):
     """Main driver."""
     config = load_config(opt.config)
     skips = config["skips"] | {opt.out}
     files = find_files(opt, skips)
-    check_file_references(files)
 
-    files = {path: data for path, data in files.items() if path.suffix == ".md"}
+    markdown = {path: data for path, data in files.items() if path.suffix == ".md"}
+    scans = scan_files(opt, {path: data["content"] for path, data in markdown.items()})
+    check_file_references(files, scans)
+
     extras = {
-        "bibliography": find_key_defs(files, "bibliography"),
-        "glossary": find_key_defs(files, "glossary"),
+        "bibliography": find_key_defs(markdown, "bibliography"),
+        "glossary": find_key_defs(markdown, "glossary"),
     }
 
     linters = [
@@ -41,44 +80,114 @@ def lint(opt):
         lint_link_references,
         lint_table_references,
     ]
-    sections = {path: data["content"] for path, data in files.items()}
-    if all(list(f(opt, config, sections, extras) for f in linters)):
+    if all(list(f(opt, config, scans, extras) for f in linters)):
         print("All self-checks passed.")
 
 
-def check_file_references(files):
+def scan_file(item):
+    """Apply every lint pattern to a single file's content."""
+    path, content = item
+    return path, {
+        name: (pattern.findall(content) if SCAN_HINTS[name] in content else [])
+        for name, pattern in SCAN_PATTERNS.items()
+    }
+
+
+def scan_files(opt, sections):
+    """Scan files, reusing cached results for files that have not changed."""
+    cache_path = Path(opt.out, CACHE_NAME)
+    cached = _load_cache(cache_path)
+
+    scans = {}
+    changed = {}
+    fingerprints = {}
+    for path, content in sections.items():
+        entry = cached.get(str(path))
+        stat = os.stat(path)
+        stat = (stat.st_mtime_ns, stat.st_size)
+        if entry and entry["stat"] == stat:
+            scans[path] = entry["scan"]
+            continue
+        digest = hashlib.blake2b(content.encode()).digest()
+        fingerprints[path] = (stat, digest)
+        if entry and entry["digest"] == digest:
+            scans[path] = entry["scan"]
+            continue
+        changed[path] = content
+    scans.update(_scan_changed(changed))
+
+    now = time.time()
+    entries = {}
+    for path, scan in scans.items():
+        if path in fingerprints:
+            stat, digest = fingerprints[path]
+            entries[str(path)] = {"stat": stat, "digest": digest, "scan": scan, "used": now}
+        else:
+            entries[str(path)] = cached[str(path)] | {"used": now}
+    _save_cache(cache_path, entries)
+
+    return scans
+
+
+def _scan_changed(sections):
+    """Scan files, in parallel when there are enough to be worth it."""
+    items = list(sections.items())
+    if len(items) < PARALLEL_THRESHOLD:
+        return dict(map(scan_file, items))
+    with ProcessPoolExecutor() as executor:
+        return dict(executor.map(scan_file, items, chunksize=8))
+
+
+def _load_cache(cache_path):
+    """Load cached scan results, discarding stale or mismatched entries."""
+    try:
+        saved = pickle.loads(cache_path.read_bytes())
+    except Exception:
+        return {}
+    if saved.get("patterns") != SCAN_FINGERPRINT:
+        return {}
+    now = time.time()
+    return {k: v for k, v in saved.get("entries", {}).items() if (now - v["used"]) < CACHE_TTL}
+
+
+def _save_cache(cache_path, entries):
+    """Save scan results, evicting the least recently used beyond the cap."""
+    if len(entries) > CACHE_LIMIT:
+        ordered = sorted(entries.items(), key=lambda item: item[1]["used"])
+        entries = dict(ordered[len(entries) - CACHE_LIMIT:])
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_bytes(pickle.dumps({"patterns": SCAN_FINGERPRINT, "entries": entries}, pickle.HIGHEST_PROTOCOL))
+
+
+def check_file_references(files, scans):
     """Check inter-file references."""
     ok = True
-    for path, data in files.items():
-        content = data["content"]
-        if path.suffix != ".md":
-            continue
-        for link in MD_FILE_LINK.finditer(content):
-            if _is_special_link(link.group(2)):
+    for path, scan in scans.items():
+        for link in scan["md_link"]:
+            if _is_special_link(link[1]):
                 continue
-            target = _resolve_path(path.parent, link.group(2))
+            target = _resolve_path(path.parent, link[1])
             if _is_missing(target, files):
                 print(f"Missing file: {path} => {target}")
                 ok = False
     return ok
 
 
-def lint_bibliography_references(opt, config, sections, extras):
+def lint_bibliography_references(opt, config, scans, extras):
     """Check bibliography references."""
     available = set(extras["bibliography"].keys())
     if available is None:
         print("No bibliography found (or multiple matches)")
         return False
-    return _check_references(sections, "bibliography", BIB_REF, available)
+    return _check_references(scans, "bibliography", "bib_ref", available)
 
 
-def lint_figure_numbers(opt, config, sections, extras):
+def lint_figure_numbers(opt, config, scans, extras):
     """Check figure numbering."""
     ok = True
-    for path, content in sections.items():
+    for path, scan in scans.items():
         current = 1
-        for caption in FIGURE_CAPTION.finditer(content):
-            text = caption.group(1)
+        for text in scan["figure_caption"]:
             if ("Figure" not in text) or (":" not in text):
                 print(f"Bad caption: {path} / '{text}'")
                 ok = False
@@ -106,51 +215,49 @@ def lint_figure_numbers(opt, config, sections, extras):
     return ok
 
 
-def lint_figure_references(opt, config, sections, extras):
+def lint_figure_references(opt, config, scans, extras):
     """Check figure references."""
-    return _check_object_refs(sections, "figure", FIGURE_DEF, FIGURE_REF)
+    return _check_object_refs(scans, "figure", "figure_def", "figure_ref")
 
 
-def lint_glossary_redefinitions(opt, config, sections, extras):
+def lint_glossary_redefinitions(opt, config, scans, extras):
     """Check glossary redefinitions."""
     found = defaultdict(set)
-    for path, content in sections.items():
+    for path, scan in scans.items():
         if "glossary" in str(path).lower():
             continue
-        for m in GLOSS_REF.finditer(content):
-            found[m[1]].add(str(path))
+        for key in scan["gloss_ref"]:
+            found[key].add(str(path))
 
     problems = {k:v for k, v in found.items() if len(v) > 1}
     for k, v in problems.items():
-        if len(v) > 1:
-            print(f"glossary key {k} redefined: {', '.join(sorted(v))}")
+        print(f"glossary key {k} redefined: {', '.join(sorted(v))}")
     return len(problems) == 0
 
 
-def lint_glossary_references(opt, config, sections, extras):
+def lint_glossary_references(opt, config, scans, extras):
     """Check glossary references."""
     available = set(extras["glossary"].keys())
     if available is None:
         print("No glossary found (or multiple matches)")
         return False
-    return _check_references(sections, "glossary", GLOSS_REF, available)
+    return _check_references(scans, "glossary", "gloss_ref", available)
 
 
-def lint_link_references(opt, config, sections, extras):
+def lint_link_references(opt, config, scans, extras):
     """Check that Markdown files use links that have been defined."""
     if not config["links"]:
         return True
-    ok = True
     links = set(config["links"].keys())
     link_refs = set()
-    for path, content in sections.items():
-        link_refs |= {m[1] for m in MD_LINK_REF.findall(content)}
+    for path, scan in scans.items():
+        link_refs |= {m[1] for m in scan["link_ref"]}
     return _report_diff(f"links used", link_refs, links)
 
 
-def lint_table_references(opt, config, sections, extras):
-    """Check figure references."""
-    return _check_object_refs(sections, "table", TABLE_DEF, TABLE_REF)
+def lint_table_references(opt, config, scans, extras):
+    """Check table references."""
+    return _check_object_refs(scans, "table", "table_def", "table_ref")
 
 
 def parse_args(parser):
@@ -161,22 +268,22 @@ def parse_args(parser):
     return parser
 
 
-def _check_object_refs(sections, kind, pattern_def, pattern_ref):
+def _check_object_refs(scans, kind, def_kind, ref_kind):
     """Check for figure and table references within each Markdown file."""
     ok = True
-    for path, content in sections.items():
-        defined = set(pattern_def.findall(content))
-        referenced = set(pattern_def.findall(content))
+    for path, scan in scans.items():
+        defined = set(scan[def_kind])
+        referenced = set(scan[ref_kind])
         ok = _report_diff(f"{path} {kind}", referenced, defined) and ok
     return ok
 
 
-def _check_references(sections, term, regexp, available):
+def _check_references(scans, term, kind, available):
     """Check all Markdown files for cross-references."""
     ok = True
     seen = set()
-    for path, content in sections.items():
-        found = {k.group(1) for k in regexp.finditer(content)}
+    for path, scan in scans.items():
+        found = set(scan[kind])
         seen |= found
         missing = found - available
         if missing:
@@ -215,11 +322,12 @@ def _report_diff(msg, refs, defs):
 
 def _resolve_path(source, dest):
     """Account for '..' in paths."""
-    while dest[:3] == "../":
+    parts = dest.split("/")
+    up = 0
+    while (up < len(parts) - 1) and (parts[up] == ".."):
         source = source.parent
-        dest = dest[3:]
-    result = Path(source, dest)
-    return result
+        up += 1
+    return Path(source, *parts[up:])
 
 
 if __name__ == "__main__":
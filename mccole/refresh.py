@@ -1,8 +1,11 @@
 """Refresh file inclusions in place."""
 
 import argparse
+import functools
+import os
 from pathlib import Path
 import re
+import stat
 
 
 COMMENT = {
@@ -11,7 +14,8 @@ COMMENT = {
     "sql": "--",
 }
 
-INC_PAT = re.compile(r'^```\s*\{.*?data-file="(.+?)".*?\}.+?^```\s*?$', re.DOTALL + re.MULTILINE)
+INC_FENCE = re.compile(r'^```\s*\{.*?data-file="(.+?)".*?\}')
+INC_FENCE_CLOSE = re.compile(r'^```\s*$')
 
 INCLUDE_BLOCK = """\
 ```{{data-file="{path}"}}
@@ -29,14 +33,36 @@ def refresh(opt):
     """Refresh inclusions in source file."""
     for filename in opt.files:
         src_path = Path(filename)
-        content = src_path.read_text()
-        content = INC_PAT.sub(lambda m: refresh_inclusion(src_path, m), content)
-        src_path.write_text(content)
-
-
-def refresh_inclusion(outer, match_obj):
+        src_path.write_text(refresh_content(src_path, src_path.read_text()))
+
+
+def refresh_content(src_path, content):
+    """Rebuild inclusion blocks in a single linear pass over the lines."""
+    lines = content.splitlines(keepends=True)
+    result = []
+    i = 0
+    while i < len(lines):
+        opening = INC_FENCE.match(lines[i])
+        if opening is None:
+            result.append(lines[i])
+            i += 1
+            continue
+        closing = i + 1
+        while (closing < len(lines)) and not INC_FENCE_CLOSE.match(lines[closing]):
+            closing += 1
+        if closing == len(lines):
+            result.extend(lines[i:])
+            break
+        block = refresh_inclusion(src_path, opening.group(1))
+        if lines[closing].endswith("\n"):
+            block += "\n"
+        result.append(block)
+        i = closing + 1
+    return "".join(result)
+
+
+def refresh_inclusion(outer, spec):
     """Refresh content of a single inclusion."""
-    spec = match_obj.group(1)
     inner, keep, content = inclusion_get(outer, spec)
     if keep is None:
         return INCLUDE_BLOCK.format(path=inner, content=content)
@@ -47,14 +73,23 @@ def refresh_inclusion(outer, match_obj):
 
 def inclusion_get(outer, inner):
     """Load external included file."""
-    if ":" in inner:
-        inner, keep = inner.split(":")
-    else:
+    inner, colon, keep = inner.partition(":")
+    if not colon:
         keep = None
     path = outer.parent / inner
-    assert path.is_file(), \
+    try:
+        status = os.stat(path)
+    except OSError:
+        status = None
+    assert status and stat.S_ISREG(status.st_mode), \
         f"Bad inclusion in {outer}: {path} does not exist or is not file"
-    return inner, keep, path.read_text()
+    return inner, keep, _read_inclusion(str(path), status.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=512)
+def _read_inclusion(path, mtime_ns):
+    """Read an included file once per path and modification time."""
+    return Path(path).read_text()
 
 
 def inclusion_keep(outer, inner, keep, content):
@@ -66,7 +101,7 @@ def inclusion_keep(outer, inner, keep, content):
     after = f"{COMMENT[suffix]} [/{keep}]"
     assert (before in content) and (after in content), \
         f"{outer} :: {inner}: missing start/end for {COMMENT[suffix]} and {keep}"
-    content = content.split(before)[1].split(after)[0]
+    content = content.partition(before)[2].partition(after)[0]
     if content[0] == "\n":
         content = content[1:]
     return content
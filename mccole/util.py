@@ -3,11 +3,17 @@
 from collections import defaultdict
 from git import Repo
 from github import Github
+import os
 from pathlib import Path
 import re
 import tomli
 import yaml
 
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 DEFAULT_CONFIG = {
     "duplicates": set(),
     "skips": set(),
@@ -19,6 +25,7 @@ SUFFIXES_SRC = {".css", ".html", ".js", ".md", ".py", ".sh", ".sql", ".txt"}
 SUFFIXES_TXT = SUFFIXES_SRC | {".csv", ".json", ".svg"}
 SUFFIXES = SUFFIXES_BIN | SUFFIXES_TXT
 TABLE_DEF = re.compile(r'<table\s+id="(.+?)"\s*>.+?<caption>(.+?)</caption>\s*</table>', re.DOTALL + re.MULTILINE)
+WRITE_CHUNK_SIZE = 1 << 20
 
 
 def find_files(opt, skips=None):
@@ -79,25 +86,41 @@ def load_config(config_path):
 
 def load_links(path):
     """Read YAML links file and convert to Markdown links."""
-    links = yaml.safe_load(Path(path).read_text())
+    links = yaml.load(Path(path).read_text(), Loader=_YamlLoader)
     return {x["key"]: x["url"] for x in links}
 
 
 def read_file(path):
     """Read file as bytes or text."""
     if path.suffix in SUFFIXES_TXT:
-        return path.read_text()
+        content = path.read_bytes().decode("utf-8")
+        return content.replace("\r\n", "\n") if ("\r" in content) else content
     else:
         return path.read_bytes()
 
 
 def write_file(path, content):
-    """Write file as bytes or text."""
+    """Write file as bytes or text, skipping writes that change nothing."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    if path.suffix in SUFFIXES_TXT:
-        return path.write_text(content)
-    else:
-        return path.write_bytes(content)
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    if _is_unchanged(path, data):
+        return
+    data = memoryview(data)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data[:WRITE_CHUNK_SIZE]):]
+    finally:
+        os.close(fd)
+
+
+def _is_unchanged(path, data):
+    """Does the file already hold exactly this content?"""
+    try:
+        return (path.stat().st_size == len(data)) and (path.read_bytes() == data)
+    except OSError:
+        return False
 
 
 def _is_interesting_file(path, skips):